@@ -1,16 +1,30 @@
-from flask import Flask
-from flask_sock import Sock
+from stage_profiler import profiler
 
-app = Flask(__name__)
-sock = Sock(app)
 
-@sock.route('/echo')
-def echo(ws):
-    while True:
-        data = ws.receive()
-        ws.send(data)
+def create_app():  # flask and flask_sock are imported here, `flask run` picks this factory up on its own.
+    from flask import Flask
+    from flask_sock import Sock
 
-if __name__ == "__main__":
+    app = Flask(__name__)
+    sock = Sock(app)
+
+    @sock.route('/echo')
+    def echo(ws):
+        while True:
+            # receive() blocks until the client sends, timing it would only measure idle time.
+            data = ws.receive()
+
+            start = profiler.clock()
+            ws.send(data)
+            profiler.record("echo;send", start)
+
+    return app
+
+
+def main():
     print("Server working")
-    app.run()
-    
+    create_app().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import atexit
+import collections
+import json
+import os
+import signal
+import threading
+import time
+
+# Opt-in per-stage timing for the message handlers.
+# Enable with STAGE_PROFILE=1. Timings are kept in a fixed size ring buffer and dumped
+# on SIGUSR1 (and at exit) either as Chrome trace JSON or as folded stacks for flamegraph.pl.
+#
+#   STAGE_PROFILE=1                      turn profiling on
+#   STAGE_PROFILE_SIZE=100000            number of samples kept in the ring buffer
+#   STAGE_PROFILE_FORMAT=chrome|folded   output format of the dump
+#   STAGE_PROFILE_OUTPUT=stage_profile   output file name (extension is added)
+
+
+class StageProfiler:
+    def __init__(self, enabled=False, size=100000, output="stage_profile", output_format="chrome"):
+        self.enabled = enabled
+        self.output = output
+        self.output_format = output_format
+        self.samples = collections.deque(maxlen=size)  # ring buffer, oldest samples are dropped first
+
+    def clock(self):  # start time of a stage, 0 when profiling is off so the hot path stays cheap.
+        if not self.enabled:
+            return 0
+        return time.perf_counter_ns()
+
+    def record(self, stage, start):  # store one finished stage. stage is a ";" separated stack, e.g. "handle_client;recv".
+        if not self.enabled:
+            return
+        # deque.append is atomic, so handler threads do not need a lock here.
+        self.samples.append((stage, threading.get_ident(), start, time.perf_counter_ns()))
+
+    def chrome_trace(self):  # samples as Chrome trace events (chrome://tracing, Perfetto).
+        events = []
+        pid = os.getpid()
+        for stage, tid, start, end in list(self.samples):
+            events.append({
+                "name": stage.rsplit(";", 1)[-1],
+                "cat": stage,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+            })
+        return json.dumps({"traceEvents": events})
+
+    def folded_stacks(self):  # samples as folded stacks with total microseconds, input for flamegraph.pl.
+        totals = collections.Counter()
+        for stage, _, start, end in list(self.samples):
+            totals[stage] += end - start  # nanoseconds, short stages would vanish if every sample was rounded to µs
+        # flamegraph.pl adds children onto their parents, so every line only keeps its own (self) time.
+        # Intermediate frames are not always recorded, so the time comes off the nearest recorded ancestor.
+        self_times = collections.Counter(totals)
+        for stage, total in totals.items():
+            ancestor = stage
+            while ";" in ancestor:
+                ancestor = ancestor.rsplit(";", 1)[0]
+                if ancestor in totals:
+                    self_times[ancestor] -= total
+                    break
+        return "\n".join(f"{stage} {max(total, 0) // 1000}" for stage, total in sorted(self_times.items())) + "\n"
+
+    def dump(self, path=None):  # write the ring buffer to disk and return the file name.
+        if self.output_format == "folded":
+            path = path or self.output + ".folded"
+            data = self.folded_stacks()
+        else:
+            path = path or self.output + ".json"
+            data = self.chrome_trace()
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR1", None)):  # dump on signal, only on platforms that have it.
+        if not self.enabled or signum is None:
+            return
+        try:
+            signal.signal(signum, lambda *_: self.dump())
+        except ValueError:  # signal handlers can only be set from the main thread
+            pass
+
+
+profiler = StageProfiler(
+    enabled=os.environ.get("STAGE_PROFILE", "") not in ("", "0"),
+    size=int(os.environ.get("STAGE_PROFILE_SIZE", "100000")),
+    output=os.environ.get("STAGE_PROFILE_OUTPUT", "stage_profile"),
+    output_format=os.environ.get("STAGE_PROFILE_FORMAT", "chrome"),
+)
+
+if profiler.enabled:
+    profiler.install_signal_handler()
+    atexit.register(profiler.dump)
@@ -0,0 +1,76 @@
+import collections
+import struct
+
+# Compact binary framing for everything the server sends to the clients.
+#
+#   magic (1 byte) | flags (1 byte) | channel id (1 byte) | username length (1 byte) | payload length (2 bytes)
+#   username (utf-8) | payload (utf-8)
+#
+# Channel messages carry the channel id, the sender and the message. Status messages ("Subscribed to IF 100",
+# ...) are text frames with FLAG_TEXT set and no username. Both share one TCP stream and can arrive in the
+# same recv, so every message is length prefixed. 0xFF never appears in utf-8 text, which lets a reader
+# find the next frame again after unframed bytes.
+
+MAGIC = 0xFF
+FLAG_FROM_SELF = 0x01  # confirmation of the receivers own message ("from you to ...")
+FLAG_TEXT = 0x02  # status message, the payload is the whole text
+
+CHANNELS = ("IF 100", "SPS 101")
+CHANNEL_IDS = {name: channel_id for channel_id, name in enumerate(CHANNELS)}
+
+HEADER = struct.Struct("!BBBBH")
+MAX_USERNAME = 0xFF
+MAX_PAYLOAD = 0xFFFF
+MAX_INTERNED = 4096
+
+ChannelMessage = collections.namedtuple("ChannelMessage", ["username", "channel", "payload", "from_self"])
+
+_usernames = {}  # raw username bytes -> interned str, so every frame from the same user reuses one string
+
+
+def encode_channel_message(username, channel, message, from_self=False):  # build one frame, raises ValueError on oversized fields.
+    name = username.encode('utf-8')
+    payload = message.encode('utf-8') if isinstance(message, str) else message
+    if len(name) > MAX_USERNAME:
+        raise ValueError("Username too long.")
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Message too long.")
+    flags = FLAG_FROM_SELF if from_self else 0
+    return HEADER.pack(MAGIC, flags, CHANNEL_IDS[channel], len(name), len(payload)) + name + payload
+
+
+def encode_text_message(text):  # build a status message frame.
+    payload = text.encode('utf-8')
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Message too long.")
+    return HEADER.pack(MAGIC, FLAG_TEXT, 0, 0, len(payload)) + payload
+
+
+def is_binary_message(data, offset=0):  # true if a binary frame starts at offset.
+    return len(data) > offset and data[offset] == MAGIC
+
+
+def decode_message(data, offset=0):  # parse the frame at offset, returns (ChannelMessage or str, next offset) or None if incomplete.
+    if len(data) - offset < HEADER.size:
+        return None
+    _, flags, channel_id, name_length, payload_length = HEADER.unpack_from(data, offset)
+    name_start = offset + HEADER.size
+    payload_start = name_start + name_length
+    end = payload_start + payload_length
+    if len(data) < end:
+        return None
+    if flags & FLAG_TEXT:
+        return str(memoryview(data)[payload_start:end], 'utf-8', 'replace'), end
+    if channel_id >= len(CHANNELS):
+        raise ValueError(f"Unknown channel id {channel_id}.")
+
+    name = bytes(data[name_start:payload_start])  # usernames are short, the bytes are the intern key
+    username = _usernames.get(name)
+    if username is None:
+        if len(_usernames) >= MAX_INTERNED:
+            _usernames.clear()
+        username = _usernames[name] = name.decode('utf-8')
+
+    # The payload stays a view into the receive buffer, decode it with str(payload, 'utf-8') when needed.
+    message = ChannelMessage(username, CHANNELS[channel_id], memoryview(data)[payload_start:end], bool(flags & FLAG_FROM_SELF))
+    return message, end
@@ -1,8 +1,16 @@
-import tkinter as tk
-from tkinter import scrolledtext, messagebox
 import socket
 import threading
 
+from binary_protocol import MAGIC, ChannelMessage, decode_message, is_binary_message
+
+tk = scrolledtext = messagebox = None  # tkinter is imported on first use, so DiSUcordClient starts fast without a GUI
+
+
+def load_tkinter():  # imports tkinter into the module globals used by the GUI and the error dialogs.
+    global tk, scrolledtext, messagebox
+    import tkinter as tk
+    from tkinter import scrolledtext, messagebox
+
 
 class DiSUcordClient:
     def __init__(self, server_ip='localhost', server_port=12345): # initializes the client object
@@ -40,21 +48,43 @@ class DiSUcordClient:
         self.disconnect_from_server()
 
     def receive_messages(self):  # continuously listen messages from the server
+        pending = b""  # start of a frame that did not fit into the last recv
         while self.running:
             try:
                 message = self.client_socket.recv(1024)
                 if len(message) == 0:
                     self.on_connection_lost()  # server connection closed
                     break
-                decoded_message = message.decode('utf-8')
-                if self.message_callback:
-                    self.message_callback(decoded_message)
+                if pending:
+                    message = pending + message
+                    pending = b""
+
+                offset = 0
+                while offset < len(message):
+                    if not is_binary_message(message, offset):  # unframed bytes, show them up to the next frame
+                        end = message.find(bytes([MAGIC]), offset)
+                        end = len(message) if end == -1 else end
+                        decoded_message = message[offset:end].decode('utf-8', 'replace')
+                        offset = end
+                    else:
+                        try:
+                            result = decode_message(message, offset)
+                        except ValueError as e:  # malformed frame, the rest of this buffer cannot be trusted
+                            print(f"Dropping malformed message: {e}")
+                            break
+                        if result is None:
+                            pending = message[offset:]
+                            break
+                        decoded_message, offset = result
+                    if self.message_callback:
+                        self.message_callback(decoded_message)
             except socket.error as e:
                 self.on_connection_lost()  # socket error, likely disconnection
                 break
 
     def send_channel_message(self, channel, message):  # send message to a specific channel
         if not self.running or channel not in self.subscribed_channels:  # check for subscription
+            load_tkinter()
             messagebox.showerror("Error", "You are not properly connected or subscribed.")
             return
 
@@ -69,6 +99,7 @@ class DiSUcordClient:
         try:
             self.client_socket.send(message.encode('utf-8'))
         except BrokenPipeError:  # for broken pipe error
+            load_tkinter()
             messagebox.showerror("Connection Error", "Connection lost. Please reconnect.")
             self.disconnect_from_server()
         except Exception as e:  # error handling
@@ -83,6 +114,7 @@ class DiSUcordClient:
 
     def subscribe_to_channel(self, channel):  # handle subscriptions
         if channel in self.subscribed_channels:  # if already subscribed
+            load_tkinter()
             messagebox.showinfo("Subscription", f"You are already subscribed to {channel}")
             return
 
@@ -91,6 +123,7 @@ class DiSUcordClient:
 
     def unsubscribe_from_channel(self, channel):  # handle unsubscriptions
         if channel not in self.subscribed_channels:
+            load_tkinter()
             messagebox.showinfo("Unsubscription", f"You are not subscribed to {channel}")
             return
 
@@ -100,6 +133,7 @@ class DiSUcordClient:
 
 class ClientGUI:
     def __init__(self, master):  # set up the ClientGUI.
+        load_tkinter()
         self.master = master
         master.title("DiSUcord Client")
         master.geometry("800x700")
@@ -312,16 +346,10 @@ class ClientGUI:
         self.master.after(0, lambda: self.handle_message(message))
 
     def handle_message(self, message): # handling messages from the users
-        if message.startswith("from you to "):
-            # Handle messages sent by the user
-            channel_message = message[len("from you to "):]
-            channel, user_message = channel_message.split(':', 1)
-            self.update_channel_message(channel.strip(), "You", user_message.strip())
-        elif ' to ' in message:
-            # Handle messages received from others
-            username, rest = message.split(' to ', 1)
-            channel, user_message = rest.split(':', 1)
-            self.update_channel_message(channel.strip(), username.strip(), user_message.strip())
+        if isinstance(message, ChannelMessage):
+            # Channel messages arrive already parsed, the sender is "You" for our own confirmations
+            username = "You" if message.from_self else message.username
+            self.update_channel_message(message.channel, username, str(message.payload, 'utf-8').strip())
         else:
             # General status message handling
             self.update_status_message(message)
@@ -372,7 +400,12 @@ class ClientGUI:
         text_widget.see(tk.END)  # Auto-scroll to the end
 
 
-# Create and run the client GUI
-root = tk.Tk()
-gui = ClientGUI(root)
-root.mainloop()
+def main():  # create and run the client GUI
+    load_tkinter()
+    root = tk.Tk()
+    gui = ClientGUI(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
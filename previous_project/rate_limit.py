@@ -0,0 +1,22 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):  # rate is tokens refilled per second, capacity is the allowed burst.
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, tokens=1):  # take tokens if available. returns False when the caller should be throttled.
+        tokens = min(tokens, self.capacity)  # a single request larger than the burst can still pass on a full bucket
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
@@ -1,22 +1,52 @@
-import threading
-import tkinter as tk
-from tkinter import scrolledtext, messagebox
+import argparse
+import selectors
+import signal
 import socket
 import threading
+import time
 import traceback
 
+from binary_protocol import encode_channel_message, encode_text_message
+from rate_limit import TokenBucket
+from stage_profiler import profiler
+
+tk = scrolledtext = messagebox = None  # tkinter is imported on first use, the headless server never loads it
+
+
+def load_tkinter():  # imports tkinter into the module globals used by the GUI.
+    global tk, scrolledtext, messagebox
+    import tkinter as tk
+    from tkinter import scrolledtext, messagebox
+
 
 class DiSUcordServer:
-    def __init__(self, host='0.0.0.0'):  # initialize the server. 0.0.0.0 is for all available interfaces.
+    def __init__(self, host='0.0.0.0', max_connections=100, message_rate=10, message_burst=20,
+                 channel_rate=200, channel_burst=400, reuse_port=False):  # initialize the server. 0.0.0.0 is for all available interfaces.
         self.gui = None
         self.host = host
         self.port = None
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port and hasattr(socket, "SO_REUSEPORT"):
+            # lets a new server process bind the same port while this one drains, for restarts without downtime
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.server_socket.settimeout(0.5)  # wake up the accept loop regularly so stop() and drain() are noticed
         self.clients = {}
         self.channels = {"IF 100": set(), "SPS 101": set()}
         self.is_running = False
+        self.is_accepting = False
+        self.is_draining = False
         self.threads = []
+        self.in_flight = 0  # messages that are being dispatched right now
+        self.drain_condition = threading.Condition()  # notified when a dispatch ends or a client leaves
+        self.drain_forced = False  # set by force_drain, ends a drain without waiting for the deadline
+        # admission control: global connection cap, per-connection message rate and per-channel fan-out rate
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        self.message_rate = message_rate
+        self.message_burst = message_burst
+        self.channel_buckets = {channel: TokenBucket(channel_rate, channel_burst) for channel in self.channels}
+        self.throttle_counts = {"rejected_connections": 0, "throttled_messages": 0, "throttled_channel_messages": 0}
+        self.throttle_lock = threading.Lock()
 
     def set_port(self, port):  # sets the port number for the server to listen on.
         self.port = port
@@ -31,12 +61,17 @@ class DiSUcordServer:
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen()
         self.is_running = True
+        self.is_accepting = True
         self.log(f"Server started on {self.host}:{self.port}")
 
         try:
-            while self.is_running:   # run a loop to accept new connections.
+            while self.is_running and self.is_accepting:   # run a loop to accept new connections.
                 try:
                     conn, addr = self.server_socket.accept()
+                    if not self.connection_slots.acquire(blocking=False):  # server is full, reject before starting a thread
+                        self.count_throttled("rejected_connections")
+                        self.reject_connection(conn)
+                        continue
                     thread = threading.Thread(target=self.handle_client, args=(conn, addr))
                     thread.start()  # start a thread for each client.
                     self.threads.append(thread)
@@ -46,7 +81,29 @@ class DiSUcordServer:
                     if not self.is_running:
                         break
         finally:
-            self.cleanup()
+            if self.is_draining:  # drain() closes the clients itself once in-flight messages are done
+                self.server_socket.close()
+            else:
+                self.cleanup()
+
+    def drain(self, deadline=5.0):  # stop accepting, keep serving connected clients until they leave or the deadline passes, then stop.
+        self.is_draining = True
+        self.is_accepting = False
+        self.log("Draining: no longer accepting new connections.")
+
+        end = time.monotonic() + deadline
+        with self.drain_condition:
+            while (self.clients or self.in_flight) and not self.drain_forced and time.monotonic() < end:
+                self.drain_condition.wait(end - time.monotonic())
+            if self.clients:
+                reason = "forced" if self.drain_forced else "deadline reached"
+                self.log(f"Drain {reason} with {len(self.clients)} clients still connected.")
+        self.stop()  # whoever is left gets the shutdown notice and is disconnected
+
+    def force_drain(self):  # make a running drain stop right away instead of waiting for the deadline.
+        with self.drain_condition:
+            self.drain_forced = True
+            self.drain_condition.notify_all()
 
     def stop(self):  # stop the server
         self.is_running = False
@@ -66,6 +123,7 @@ class DiSUcordServer:
         for t in self.threads:
             t.join(timeout=1)
 
+        self.log(f"Throttling counters: {self.get_throttle_counts()}")
         self.log("Server stopped.")
 
     def cleanup(self):  # closes all client connections and closes server socket.
@@ -78,8 +136,29 @@ class DiSUcordServer:
         for thread in self.threads:  # wait for all threads to finish.
             thread.join()
 
+    def reject_connection(self, conn):  # tell an over the limit client to retry later and close it right away.
+        try:
+            conn.send(encode_text_message("Server is full. Please try again later."))
+        except Exception:
+            pass
+        conn.close()
+
+    def count_throttled(self, counter):  # increments one of the throttling counters.
+        with self.throttle_lock:
+            self.throttle_counts[counter] += 1
+
+    def get_throttle_counts(self):  # returns a copy of the throttling counters.
+        with self.throttle_lock:
+            return dict(self.throttle_counts)
+
     def handle_client(self, conn, addr):  # manages communication with a single client.
         username = None
+        bucket = TokenBucket(self.message_rate, self.message_burst)  # per-connection message limit
+        throttle_notified = False  # the client is told once per stretch of dropped messages, not once per message
+        readable = None
+        if profiler.enabled:  # waits for data outside the timer, so recv does not include idle time
+            readable = selectors.DefaultSelector()  # epoll/kqueue where available, no FD_SETSIZE limit
+            readable.register(conn, selectors.EVENT_READ)
         try:
             username = conn.recv(1024).decode('utf-8')
             if not username:
@@ -87,7 +166,7 @@ class DiSUcordServer:
                 return
 
             if username in self.clients:  # for duplicate usernames.
-                conn.send("Username already in use. Please try a different username.".encode('utf-8'))
+                conn.send(encode_text_message("Username already in use. Please try a different username."))
             else:
                 self.clients[username] = conn
                 self.log(f"{username} connected from {addr}")
@@ -95,18 +174,42 @@ class DiSUcordServer:
 
             while self.is_running:
                 try:
-                    message = conn.recv(1024).decode('utf-8')
+                    if readable:
+                        readable.select()
+                    start = profiler.clock()
+                    data = conn.recv(1024)
+                    profiler.record("handle_client;recv", start)
+
+                    start = profiler.clock()
+                    message = data.decode('utf-8')
+                    profiler.record("handle_client;parse", start)
                     if not message:
                         break
-
-                    if message.startswith("subscribe:"):  # handle subscriptions
-                        self.handle_subscribe(username, message, conn)
-                    elif message.startswith("unsubscribe:"):  # handle unsubscriptions
-                        self.handle_unsubscribe(username, message, conn)
-                    elif ":" in message:
-                        self.handle_channel_message(username, message)
+                    throttled = not bucket.consume()
+                    if throttled:  # over the per-connection limit, drop the message
+                        self.count_throttled("throttled_messages")
                     else:
-                        break
+                        start = profiler.clock()
+                        with self.drain_condition:
+                            self.in_flight += 1
+                        try:
+                            if message.startswith("subscribe:"):  # handle subscriptions
+                                self.handle_subscribe(username, message, conn)
+                            elif message.startswith("unsubscribe:"):  # handle unsubscriptions
+                                self.handle_unsubscribe(username, message, conn)
+                            elif ":" in message:
+                                throttled = self.handle_channel_message(username, message)
+                            else:
+                                break
+                        finally:
+                            with self.drain_condition:
+                                self.in_flight -= 1
+                                self.drain_condition.notify_all()
+                        profiler.record("handle_client;dispatch", start)
+
+                    if throttled and not throttle_notified:
+                        conn.send(encode_text_message("Rate limit exceeded, message dropped."))
+                    throttle_notified = throttled
                 except socket.error as e:  # error handling
                     if not self.is_running:
                         break
@@ -116,7 +219,10 @@ class DiSUcordServer:
                     self.log(f"Unexpected error with {username}: {e}")
                     break
         finally:
+            if readable:
+                readable.close()
             self.cleanup_client(username, conn)
+            self.connection_slots.release()
 
         self.log(f"Connection with {username} closed")
 
@@ -124,11 +230,11 @@ class DiSUcordServer:
         channel = message.split(":")[1]
         if username in self.channels[channel]:  # if already subscribed
             self.log(f"{username} is already subscribed to {channel}")
-            conn.send(f"Already subscribed to {channel}".encode('utf-8'))
+            conn.send(encode_text_message(f"Already subscribed to {channel}"))
         else:
             self.channels[channel].add(username)
             self.log(f"{username} subscribed to {channel}")
-            conn.send(f"Subscribed to {channel}".encode('utf-8'))
+            conn.send(encode_text_message(f"Subscribed to {channel}"))
         self.update_client_lists()
 
     def handle_unsubscribe(self, username, message, conn):  # handle unsubscriptions
@@ -136,32 +242,47 @@ class DiSUcordServer:
         if username in self.channels[channel]:
             self.channels[channel].discard(username)
             self.log(f"{username} unsubscribed from {channel}")
-            conn.send(f"Unsubscribed from {channel}".encode('utf-8'))
+            conn.send(encode_text_message(f"Unsubscribed from {channel}"))
         self.update_client_lists()
 
-    def handle_channel_message(self, username, message):  # process messages send to a channel
+    def handle_channel_message(self, username, message):  # process messages send to a channel, returns True if throttled
         try:
+            start = profiler.clock()
             channel, msg = message.split(':', 1)
+            profiler.record("handle_client;dispatch;handle_channel_message;parse", start)
             if channel in self.channels and username in self.channels[channel]:
+                # Every inbound message costs one token per recipient, so the limit caps the channel's egress.
+                # TokenBucket.consume clamps the cost to the burst: a channel with more subscribers than
+                # channel_burst is charged channel_burst per message and may send more than channel_rate.
+                if not self.channel_buckets[channel].consume(len(self.channels[channel])):
+                    self.count_throttled("throttled_channel_messages")
+                    return True
                 # Log the message being handled
                 self.log(f"Handling message from {username} to {channel}: {msg}")
 
-                # Construct the message to be sent to other clients
-                formatted_message = f"{username} to {channel}: {msg}"
+                # Construct the frame to be sent to other clients, encoded once for all subscribers
+                formatted_message = encode_channel_message(username, channel, msg)
                 # Send the message to all subscribed clients except the sender
+                fanout_start = profiler.clock()
                 for subscriber in self.channels[channel]:
                     if subscriber != username:  # Exclude the sender
                         client_conn = self.clients.get(subscriber)
                         if client_conn:
                             self.log(f"Sending message to {subscriber}")  # Log who we're sending the message to
-                            client_conn.send(formatted_message.encode('utf-8'))
+                            start = profiler.clock()
+                            client_conn.send(formatted_message)
+                            profiler.record("handle_client;dispatch;handle_channel_message;fanout;send", start)
+                profiler.record("handle_client;dispatch;handle_channel_message;fanout", fanout_start)
                 # Send a confirmation to the sender
                 sender_conn = self.clients.get(username)
                 if sender_conn:
                     self.log(f"Confirming message to sender {username}")  # Log the confirmation
-                    sender_conn.send(f"from you to {channel}: {msg}".encode('utf-8'))
+                    start = profiler.clock()
+                    sender_conn.send(encode_channel_message(username, channel, msg, from_self=True))
+                    profiler.record("handle_client;dispatch;handle_channel_message;send", start)
         except Exception as e:
             self.log(f"Error handling message: {e}")
+        return False
 
     def cleanup_client(self, username, conn):  # remove a client from server's records
         if username and username in self.clients:
@@ -171,13 +292,15 @@ class DiSUcordServer:
             self.log(f"{username} has disconnected.")
             self.update_client_lists()
         conn.close()  # close that clients connection
+        with self.drain_condition:  # a drain waits for the last client to leave
+            self.drain_condition.notify_all()
 
     def multicast_message(self, message, channel):  # send a message to all subscribed channel users, with specified channel
         for user in list(self.channels[channel]):  # Convert to list to avoid modifying the set during iteration
             client_conn = self.clients.get(user)
             if client_conn:
                 try:
-                    client_conn.send(message.encode('utf-8'))
+                    client_conn.send(encode_text_message(message))
                 except (BrokenPipeError, ConnectionError) as e:
                     # Handle the error, e.g., log it, remove the client, or take appropriate action
                     self.log(f"Error sending message to {user}: {e}")
@@ -190,14 +313,14 @@ class DiSUcordServer:
     def notify_all(self, message):  # send a message to all connected clients
         for client_conn in self.clients.values():
             try:
-                client_conn.send(message.encode('utf-8'))
+                client_conn.send(encode_text_message(message))
             except Exception as e:
                 self.log(f"Error sending notification: {e}")
 
     def notify_all_clients(self, message):  # notifies all clients about server-wide events or messages.
         for _, client_conn in list(self.clients.items()):
             try:
-                client_conn.send(message.encode('utf-8'))
+                client_conn.send(encode_text_message(message))
             except Exception as e:
                 self.log(f"Error notifying client: {e}")
 
@@ -219,6 +342,7 @@ class DiSUcordServer:
 
 class ServerGUI:
     def __init__(self, master):  # initialize the ServerGUI.
+        load_tkinter()
         self.master = master
         master.title("DiSUcord Server")
         master.geometry("600x700")
@@ -326,6 +450,38 @@ class ServerGUI:
         self.master.destroy()
 
 
-root = tk.Tk()
-gui = ServerGUI(root)
-root.mainloop()
+def run_headless(port):  # runs the server without a GUI, SIGTERM drains it and a second SIGTERM skips the deadline.
+    server = DiSUcordServer(reuse_port=True)
+    server.set_port(port)
+    server.set_log_callback(print)
+    draining = threading.Event()
+
+    def on_sigterm(*_):  # only the first signal starts a drain, so stop() never runs twice
+        if draining.is_set():
+            server.force_drain()
+            return
+        draining.set()
+        threading.Thread(target=server.drain).start()
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    server.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DiSUcord server")
+    parser.add_argument("--headless", action="store_true", help="run without the GUI")
+    parser.add_argument("--port", type=int, default=12345)
+    args = parser.parse_args()
+
+    if args.headless:
+        run_headless(args.port)
+        return
+
+    load_tkinter()
+    root = tk.Tk()
+    gui = ServerGUI(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import websockets
+
+from open_loop_tester import run_open_loop
+
+
+# Runs the benchmark matrix from a scenario file (see scenarios.json) without supervision.
+# Every target server is started locally, either directly or from its Dockerfile, optionally pinned
+# to a set of CPUs, and every combination of concurrency, payload size and rate is measured after a
+# warmup run. Each measurement is appended as one JSON line to the results file.
+
+STARTUP_TIMEOUT = 60  # seconds, docker builds are not part of this
+
+
+def wait_for_port(host, port, timeout=STARTUP_TIMEOUT):  # poll until the server accepts a connection, returns the seconds it took.
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError(f"Nothing accepted connections on {host}:{port} after {timeout} seconds.")
+
+
+def wait_for_websocket(uri, timeout=STARTUP_TIMEOUT):  # retry a full websocket handshake until one succeeds.
+    # docker-proxy accepts TCP on the published port before the app in the container listens, so an open
+    # port does not mean the server is ready.
+    async def handshake():
+        async with websockets.connect(uri, open_timeout=1):
+            pass
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            asyncio.run(handshake())
+            return time.perf_counter() - start
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            time.sleep(0.1)
+    raise TimeoutError(f"No websocket handshake with {uri} succeeded after {timeout} seconds.")
+
+
+def parse_cpuset(cpuset):  # "0-1,3" -> {0, 1, 3}
+    cpus = set()
+    for part in cpuset.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def client_cpus(scenario):  # CPUs for the load generator: client_cpuset, or every CPU outside the server's cpuset.
+    if scenario.get("client_cpuset"):
+        return parse_cpuset(scenario["client_cpuset"])
+    if not scenario.get("cpuset") or not hasattr(os, "sched_getaffinity"):
+        return None
+    cpus = os.sched_getaffinity(0) - parse_cpuset(scenario["cpuset"])
+    if not cpus:
+        print("Warning: no CPUs left outside cpuset, the load generator shares CPUs with the server.")
+        return None
+    return cpus
+
+
+class LocalServer:  # a target started as a plain process, pinned with sched_setaffinity where available.
+    def __init__(self, target, scenario):
+        self.target = target
+        self.cpuset = scenario.get("cpuset")
+        self.process = None
+
+    def start(self):
+        preexec_fn = None
+        if self.cpuset and hasattr(os, "sched_setaffinity"):
+            cpus = parse_cpuset(self.cpuset)
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+        self.process = subprocess.Popen(self.target["command"], cwd=self.target["directory"], preexec_fn=preexec_fn)
+
+    def stop(self):
+        if self.process is None:  # start() failed
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def pid(self):
+        return self.process.pid
+
+
+class DockerServer:  # a target built from its Dockerfile and run with CPU pinning and limits.
+    def __init__(self, target, scenario):
+        self.target = target
+        self.image = f"websocket-benchmark-{target['name']}"
+        self.limits = []
+        if scenario.get("cpuset"):
+            self.limits += ["--cpuset-cpus", scenario["cpuset"]]
+        if scenario.get("cpus"):
+            self.limits += ["--cpus", str(scenario["cpus"])]
+        if scenario.get("memory"):
+            self.limits += ["--memory", scenario["memory"]]
+
+    def start(self):
+        subprocess.run(["docker", "build", "-t", self.image, self.target["directory"]], check=True)
+        port = self.target["port"]
+        # A container left over from an interrupted run still holds the name and the port.
+        subprocess.run(["docker", "rm", "-f", self.image], check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run(["docker", "run", "-d", "--rm", "--name", self.image, "-p", f"{port}:{port}",
+                        *self.limits, self.image], check=True)
+
+    def stop(self):
+        subprocess.run(["docker", "stop", self.image], check=False)
+
+    def pid(self):
+        return None
+
+
+class CpuMonitor:  # samples the CPU usage of the server process while a measurement runs.
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.pid is None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        import psutil
+        process = psutil.Process(self.pid)
+        process.cpu_percent()
+        while self.running:
+            time.sleep(1)
+            self.samples.append(process.cpu_percent())
+
+    def stop(self):  # returns the average CPU usage in percent, None when nothing was measured.
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        return sum(self.samples) / len(self.samples) if self.samples else None
+
+
+def load_scenario(path):  # reads the scenario file, target directories are relative to it.
+    with open(path) as f:
+        scenario = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for target in scenario["targets"]:
+        target["directory"] = os.path.normpath(os.path.join(base, target["directory"]))
+    scenario["results_file"] = os.path.join(base, scenario.get("results_file", "matrix_results.jsonl"))
+    return scenario
+
+
+def write_record(results_file, record):
+    with open(results_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def run_cell(server, uri, scenario, cpus, concurrency, payload_size, rate):  # one warmup and one measured run.
+    processes = min(concurrency, scenario.get("processes", 1))
+    distribution = scenario.get("distribution", "poisson")
+    if scenario.get("warmup"):
+        run_open_loop(uri, rate, scenario["warmup"], concurrency, processes, distribution, payload_size, cpus=cpus)
+
+    monitor = CpuMonitor(server.pid())
+    monitor.start()
+    try:
+        results = run_open_loop(uri, rate, scenario["duration"], concurrency, processes, distribution, payload_size,
+                                cpus=cpus)
+    finally:
+        server_cpu = monitor.stop()
+    results["server_cpu"] = server_cpu
+    return results
+
+
+def run_target(target, scenario, results_file):
+    server = DockerServer(target, scenario) if scenario.get("runner") == "docker" else LocalServer(target, scenario)
+    uri = f"ws://127.0.0.1:{target['port']}{target.get('path', '/')}"
+    try:
+        server.start()
+        wait_for_websocket(uri)
+        cpus = client_cpus(scenario)
+        matrix = itertools.product(scenario["concurrency"], scenario["payload_sizes"], scenario["rates"],
+                                   range(1, scenario.get("repeats", 1) + 1))
+        for concurrency, payload_size, rate, repeat in matrix:
+            record = {"target": target["name"], "runner": scenario.get("runner", "local"), "concurrency": concurrency,
+                      "payload_size": payload_size, "rate": rate, "repeat": repeat, "time": time.time()}
+            label = f"{target['name']} concurrency={concurrency} payload={payload_size} rate={rate} repeat={repeat}"
+            try:
+                results = run_cell(server, uri, scenario, cpus, concurrency, payload_size, rate)
+            except Exception as e:  # one failing cell must not cost the rest of an unattended run
+                write_record(results_file, {**record, "error": repr(e)})
+                print(f"{label}: failed with {e!r}")
+                continue
+            write_record(results_file, {**record, **results})
+            print(f"{label}: p50 {results['p50']:.4f}s p99 {results['p99']:.4f}s lost {results['lost']}")
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the WebSocket benchmark matrix from a scenario file.")
+    parser.add_argument("scenario", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     "scenarios.json"))
+    parser.add_argument("--targets", nargs="*", help="only run these targets")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    for target in scenario["targets"]:
+        if args.targets and target["name"] not in args.targets:
+            continue
+        try:
+            run_target(target, scenario, scenario["results_file"])
+        except Exception as e:  # e.g. the image does not build or the server never answers, go on with the next target
+            write_record(scenario["results_file"], {"target": target["name"], "runner": scenario.get("runner", "local"),
+                                                    "time": time.time(), "error": repr(e)})
+            print(f"{target['name']}: failed with {e!r}")
+
+
+if __name__ == "__main__":
+    main()
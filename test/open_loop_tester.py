@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import random
+import time
+import websockets
+
+
+# Open-loop load generator. tester.py waits for every response before it sends the next message, so a
+# stalled server just makes the client wait and the stall never shows up in the RTTs (coordinated
+# omission). Here every message has an intended send time taken from a precomputed arrival schedule,
+# messages are sent on schedule whether or not earlier responses came back, and latency is measured
+# from the intended send time. The connections are spread over several processes so the load generator
+# itself does not become the bottleneck.
+
+RESPONSE_TIMEOUT = 5  # seconds to wait for outstanding responses after the last send
+CONNECT_TIMEOUT = 30  # seconds every worker gets to open its connections
+START_DELAY = 0.1  # seconds between the last worker being connected and the first scheduled send
+
+start_barrier = None  # set in every worker by init_worker
+shared_start_at = None
+
+
+def build_schedule(rate, duration, distribution="constant", phase=0.0, seed=None):  # intended send times in seconds from the start.
+    if distribution == "constant":
+        count = int(duration * rate)
+        return [phase + i / rate for i in range(count) if phase + i / rate < duration]
+    if distribution == "poisson":
+        rng = random.Random(seed)
+        schedule = []
+        t = rng.expovariate(rate)
+        while t < duration:
+            schedule.append(t)
+            t += rng.expovariate(rate)
+        return schedule
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+
+async def run_connection(websocket, schedule, start_at, payload):  # send on schedule, returns (latencies, sent, lost).
+    loop = asyncio.get_running_loop()
+    base = loop.time() + (start_at - time.time())  # shared wall clock start time, converted to this loop's clock
+    intended = {}
+    latencies = []
+    done = asyncio.Event()
+    sending_done = False
+
+    async def receive():
+        try:
+            async for message in websocket:
+                sequence = int(message.split(" ", 1)[0])
+                latencies.append(loop.time() - intended.pop(sequence))
+                if sending_done and not intended:
+                    done.set()
+        except websockets.ConnectionClosed:
+            done.set()
+
+    receiver = asyncio.create_task(receive())
+    sent = 0
+    try:
+        for sequence, offset in enumerate(schedule):
+            send_at = base + offset
+            delay = send_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            intended[sequence] = send_at  # late sends still count from the time they should have gone out
+            await websocket.send(f"{sequence} {payload}")
+            sent += 1
+    except websockets.ConnectionClosed:
+        pass  # the server went away, everything unsent or unanswered is counted as lost
+    sending_done = True
+
+    if intended:
+        try:
+            await asyncio.wait_for(done.wait(), RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+    receiver.cancel()
+
+    return latencies, sent, len(schedule) - len(latencies)
+
+
+def init_worker(barrier, start_at, cpus):  # pool initializer, shares the start barrier and start time with every worker.
+    global start_barrier, shared_start_at
+    start_barrier = barrier
+    shared_start_at = start_at
+    if cpus and hasattr(os, "sched_setaffinity"):  # keep the load generator off the CPUs of the server under test
+        os.sched_setaffinity(0, cpus)
+
+
+def synchronize_start():  # blocks until every worker is connected, returns the shared start time.
+    if start_barrier.wait(timeout=CONNECT_TIMEOUT) == 0:
+        shared_start_at.value = time.time() + START_DELAY
+    start_barrier.wait(timeout=CONNECT_TIMEOUT)  # nobody reads the start time before it is set
+    return shared_start_at.value
+
+
+async def run_connections(uri, schedules, payload):
+    try:
+        connections = await asyncio.gather(*(websockets.connect(uri) for _ in schedules))
+    except Exception:
+        start_barrier.abort()  # do not leave the other workers waiting for this one
+        raise
+
+    # The clock starts once every connection of every worker is open, so pool start up and connection
+    # setup never show up as latency of the first messages.
+    start_at = synchronize_start()
+    try:
+        return await asyncio.gather(*(run_connection(websocket, schedule, start_at, payload)
+                                      for websocket, schedule in zip(connections, schedules)))
+    finally:
+        await asyncio.gather(*(websocket.close() for websocket in connections))
+
+
+def worker(args):  # runs in its own process, one event loop driving several connections.
+    uri, schedules, payload = args
+    latencies, sent, lost = [], 0, 0
+    for connection_latencies, connection_sent, connection_lost in asyncio.run(
+            run_connections(uri, schedules, payload)):
+        latencies.extend(connection_latencies)
+        sent += connection_sent
+        lost += connection_lost
+    return latencies, sent, lost
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def run_open_loop(uri, rate, duration, connections=1, processes=1, distribution="constant", payload_size=16, seed=None,
+                  cpus=None):
+    # Every connection gets an equal share of the rate. Constant schedules are phase shifted so the
+    # combined arrivals are evenly spaced, poisson streams add up to a poisson stream of the full rate.
+    connection_rate = rate / connections
+    schedules = [build_schedule(connection_rate, duration, distribution, phase=i / rate,
+                                seed=None if seed is None else seed + i) for i in range(connections)]
+    processes = min(processes, connections)
+    payload = "x" * payload_size
+    jobs = [(uri, schedules[i::processes], payload) for i in range(processes)]
+
+    barrier = multiprocessing.Barrier(processes)
+    start_at = multiprocessing.Value("d", 0.0)
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(barrier, start_at, cpus)) as pool:
+        results = pool.map(worker, jobs)
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    sent = sum(result[1] for result in results)
+    lost = sum(result[2] for result in results)
+    return {
+        "target_rate": rate,
+        "achieved_rate": len(latencies) / duration,
+        "sent": sent,
+        "lost": lost,
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "p999": percentile(latencies, 0.999),
+        "max": latencies[-1] if latencies else float("nan"),
+        "mean": sum(latencies) / len(latencies) if latencies else float("nan"),
+    }
+
+
+def write_results(log_file, test_number, results):
+    with open(log_file, "a") as f:
+        f.write(f"Test {test_number}:\n"
+                f"Rate: {results['achieved_rate']:.1f}/{results['target_rate']:.1f} msg/s, "
+                f"sent {results['sent']}, lost {results['lost']}\n"
+                f"Latency p50: {results['p50']:.4f} p90: {results['p90']:.4f} p99: {results['p99']:.4f} "
+                f"p99.9: {results['p999']:.4f} max: {results['max']:.4f} seconds\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop WebSocket echo load test.")
+    parser.add_argument("--uri", default="ws://localhost:8888")
+    parser.add_argument("--rate", type=float, default=100, help="total messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per test")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--distribution", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--payload-size", type=int, default=16)
+    parser.add_argument("--tests", type=int, default=1)
+    parser.add_argument("--log-file", default="performance_log_open_loop.txt")
+    args = parser.parse_args()
+
+    for test_number in range(1, args.tests + 1):
+        results = run_open_loop(args.uri, args.rate, args.duration, args.connections, args.processes,
+                                args.distribution, args.payload_size)
+        write_results(args.log_file, test_number, results)
+        print(f"Test {test_number}: {results}")
+
+
+if __name__ == "__main__":
+    main()
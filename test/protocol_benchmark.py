@@ -0,0 +1,57 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "previous_project"))
+
+from binary_protocol import decode_message, encode_channel_message
+
+
+# Compares the old f-string/split text format of DiSUcord channel messages with the binary frames.
+
+def encode_text(username, channel, msg):
+    return f"{username} to {channel}: {msg}".encode('utf-8')
+
+
+def decode_text(data):  # same parsing as the old ClientGUI.handle_message
+    message = data.decode('utf-8')
+    username, rest = message.split(' to ', 1)
+    channel, user_message = rest.split(':', 1)
+    return username.strip(), channel.strip(), user_message.strip()
+
+
+def decode_binary(data):
+    message, _ = decode_message(data)
+    return message.username, message.channel, str(message.payload, 'utf-8')
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<28}{seconds / number * 1e9:10.0f} ns/op")
+
+
+def run_benchmark(payload_size, number=200000):
+    username, channel, msg = "ege", "IF 100", "x" * payload_size
+    text = encode_text(username, channel, msg)
+    binary = encode_channel_message(username, channel, msg)
+
+    print(f"Payload {payload_size} bytes: text frame {len(text)} bytes, binary frame {len(binary)} bytes")
+    bench("text encode", lambda: encode_text(username, channel, msg), number)
+    bench("binary encode", lambda: encode_channel_message(username, channel, msg), number)
+    bench("text decode", lambda: decode_text(text), number)
+    bench("binary decode", lambda: decode_binary(binary), number)
+    bench("binary decode (payload view)", lambda: decode_message(binary), number)
+    print()
+
+
+def check_ambiguous_input():  # the text format cannot carry " to " or ":" in usernames
+    username, channel, msg = "alice to bob", "SPS 101", "time: 12:00"
+    print("text decode:  ", decode_text(encode_text(username, channel, msg)))
+    print("binary decode:", decode_binary(encode_channel_message(username, channel, msg)))
+    print()
+
+
+if __name__ == "__main__":
+    check_ambiguous_input()
+    for payload_size in (16, 256, 1000):
+        run_benchmark(payload_size)
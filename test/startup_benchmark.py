@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from matrix_runner import LocalServer, load_scenario, wait_for_port
+
+
+# Measures the cold start of every server: the time from spawning the process until the first
+# connection is accepted on its port. The echo servers come from the scenario file, the DiSUcord
+# server is started headless.
+
+DISUCORD_TARGET = {
+    "name": "disucord",
+    "directory": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "previous_project"),
+    "command": [sys.executable, "serverGUI.py", "--headless", "--port", "12345"],
+    "port": 12345,
+}
+
+
+def measure_startup(target, scenario):  # seconds until the first accepted connection for one cold start.
+    server = LocalServer(target, scenario)
+    start = time.perf_counter()
+    server.start()
+    try:
+        wait_for_port("127.0.0.1", target["port"])
+        return time.perf_counter() - start
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time to first accepted connection of each server.")
+    parser.add_argument("scenario", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     "scenarios.json"))
+    parser.add_argument("--targets", nargs="*", help="only run these targets")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--log-file", default="startup_log.txt")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    for target in scenario["targets"] + [DISUCORD_TARGET]:
+        if args.targets and target["name"] not in args.targets:
+            continue
+        times = [measure_startup(target, scenario) for _ in range(args.runs)]
+        with open(args.log_file, "a") as f:
+            f.write(f"Target {target['name']}:\n"
+                    f"Time to first accepted connection: min {min(times):.4f} median {statistics.median(times):.4f} "
+                    f"max {max(times):.4f} seconds over {len(times)} runs\n\n")
+        print(f"{target['name']}: min {min(times):.4f}s median {statistics.median(times):.4f}s max {max(times):.4f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
+import argparse
 import asyncio
 import time
 import websockets
-import psutil
 
 
 async def test_websocket(uri, test_number, log_file):
@@ -23,6 +23,8 @@ async def test_websocket(uri, test_number, log_file):
 
 
 def monitor_cpu(test_number, duration, log_file):
+    import psutil  # only needed here, keeps the startup of short runs fast
+
     cpu_usages = []
     start_time = time.time()
     while time.time() - start_time < duration:
@@ -38,10 +40,17 @@ async def run_test(uri, test_number, duration, log_file):
     monitor_cpu(test_number, duration, log_file)
 
 
-if __name__ == "__main__":
-    uri = "ws://34.27.115.104:8082"
-    log_file = "performance_log_websockets_gcp.txt"
-    duration = 20  # Duration of each test in seconds
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop WebSocket RTT and CPU test.")
+    parser.add_argument("--uri", default="ws://34.27.115.104:8082")
+    parser.add_argument("--log-file", default="performance_log_websockets_gcp.txt")
+    parser.add_argument("--duration", type=int, default=20, help="duration of each test in seconds")
+    parser.add_argument("--tests", type=int, default=50)
+    args = parser.parse_args()
+
+    for test_number in range(1, args.tests + 1):
+        asyncio.run(run_test(args.uri, test_number, args.duration, args.log_file))
 
-    for test_number in range(1, 51):
-        asyncio.run(run_test(uri, test_number, duration, log_file))
+
+if __name__ == "__main__":
+    main()
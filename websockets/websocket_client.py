@@ -8,4 +8,9 @@ async def hello():
         print(f"Received from server: {response}")
 
 
-asyncio.get_event_loop().run_until_complete(hello())
+def main():
+    asyncio.run(hello())
+
+
+if __name__ == "__main__":
+    main()
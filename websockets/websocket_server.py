@@ -1,11 +1,59 @@
 import asyncio
+import os
+import signal
+import socket
 import websockets
 
-async def echo(websocket, path):
-    async for message in websocket:
-        await websocket.send(message)
+from stage_profiler import profiler
 
-start_server = websockets.serve(echo, "0.0.0.0", 8888)
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", "8"))  # stay below docker's 10 second stop grace period
 
-asyncio.get_event_loop().run_until_complete(start_server)
-asyncio.get_event_loop().run_forever()
+connections = set()
+
+async def echo(websocket, path=None):  # path is only passed by older websockets versions
+    connections.add(websocket)
+    try:
+        # Receiving cannot be told apart from waiting for the client here, so only the send is timed.
+        async for message in websocket:
+            start = profiler.clock()
+            await websocket.send(message)
+            profiler.record("echo;send", start)
+    finally:
+        connections.discard(websocket)
+
+async def drain(server, timeout, force):
+    # Stop listening but keep open connections, a new process bound with SO_REUSEPORT takes the new ones.
+    server.server.close()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while connections and loop.time() < deadline and not force.is_set():
+        await asyncio.sleep(0.1)
+    # Whatever is left gets a going away close frame after its pending sends.
+    server.close()
+    await server.wait_closed()
+
+async def serve():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    force = asyncio.Event()  # a second signal skips the rest of the drain deadline
+
+    def on_signal():
+        if stop.is_set():
+            force.set()
+        stop.set()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, on_signal)
+        except NotImplementedError:  # no signal handlers on windows event loops
+            pass
+
+    server = await websockets.serve(echo, "0.0.0.0", 8888, reuse_port=hasattr(socket, "SO_REUSEPORT"))
+    await stop.wait()
+    await drain(server, DRAIN_TIMEOUT, force)
+
+def main():
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()